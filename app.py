@@ -3,17 +3,25 @@
 # This app uses Streamlit to create a user interface for an AI-powered fashion stylist powered by a local open-source model via Ollama.
 
 import os
+import time
+import uuid
 import streamlit as st
-import base64
 import requests
-from PIL import Image
-from io import BytesIO
+from diagnostics import diagnostics_enabled, render_diagnostics
+from memory_budget import MemoryBudget, budget_from_env, digest, start_tracing_from_env
+from image_pool import ImagePoolError, ImageWorkerPool, pool_from_env
+from image_prep import prepare_ollama_payload, prepare_preview
+from generation import DEFAULT_OLLAMA_TIERS, OLLAMA_API_URL, generate_with_ollama
+from model_tiers import TierController, load_tier_ladder
 
 # --- Configuration ---
-# Ollama runs a local server at this address by default
-OLLAMA_API_URL = "http://localhost:11434/api/generate"
-# Use a VLM model installed via Ollama (e.g., llava or qwen-vl)
-MODEL_NAME = "llava:7b" 
+# Ollama runs a local server at OLLAMA_API_URL (see generation.py)
+# Ladder of VLM models installed via Ollama (e.g., llava or qwen-vl), fastest first.
+# Defaults to DEFAULT_OLLAMA_TIERS in generation.py; override with OLLAMA_MODEL_TIERS.
+# Target end-to-end latency; under load the controller drops to smaller tiers to stay within it
+LATENCY_SLO_S = float(os.getenv("MUSE_LATENCY_SLO_S", "20"))
+# Number of requests Ollama serves in parallel (matches Ollama's own OLLAMA_NUM_PARALLEL)
+OLLAMA_NUM_PARALLEL = int(os.getenv("OLLAMA_NUM_PARALLEL", "1"))
 
 # --- UI Customization: Injected CSS for Lavender Theme ---
 CUSTOM_CSS = """
@@ -76,62 +84,92 @@ h2, h3, .st-emotion-cache-1qg6de1 {
 """
 
 
-# --- Function to Encode Image and Call Ollama ---
-# def encode_image_to_base64(image: Image.Image) -> str:
-#     """Converts a PIL Image object to a base64 string for the Ollama API."""
-#     buffered = BytesIO()
-#     # JPEG is often a good default for size/quality balance
-#     image.save(buffered, format="JPEG")
-#     return base64.b64encode(buffered.getvalue()).decode('utf-8')
-def encode_image_to_base64(image: Image.Image) -> str:
-    """Converts a PIL Image object to a base64 string for the Ollama API."""
-    # Convert RGBA or LA to RGB since JPEG doesn't support alpha
-    if image.mode in ("RGBA", "LA"):
-        image = image.convert("RGB")
-    
-    buffered = BytesIO()
-    image.save(buffered, format="JPEG")
-    return base64.b64encode(buffered.getvalue()).decode("utf-8")
+# --- Function to Call Ollama ---
+@st.cache_resource
+def get_tier_controller() -> TierController:
+    """One controller per process, so tier decisions see the load from every session."""
+    return TierController(
+        load_tier_ladder("OLLAMA_MODEL_TIERS", DEFAULT_OLLAMA_TIERS),
+        target_latency_s=LATENCY_SLO_S,
+        concurrency=OLLAMA_NUM_PARALLEL,
+    )
+
+@st.cache_resource
+def get_image_pool() -> ImageWorkerPool:
+    """One bounded worker pool per process for decoding and encoding every session's uploads."""
+    return pool_from_env()
 
-def generate_outfit_suggestion_local(wardrobe_image: Image.Image, occasion_description: str) -> str:
+@st.cache_resource
+def get_memory_budget() -> MemoryBudget:
+    """One memory budget per process for every session's cached payloads and results."""
+    start_tracing_from_env()
+    return budget_from_env()
+
+def generate_outfit_suggestion_local(wardrobe_upload: bytes, occasion_description: str) -> tuple[str, str]:
     """
-    Calls the local Ollama API to analyze the wardrobe image and suggest an outfit.
+    Calls the local Ollama API to analyze the uploaded wardrobe image and suggest an outfit.
+    Returns the suggestion and the name of the model tier that served it (None on failure).
     """
     
-    # 1. Encode the image
-    base64_image = encode_image_to_base64(wardrobe_image)
-
-    # 2. Construct the User Prompt
-    prompt = (
-        f"You are an expert personal stylist. Analyze the entire wardrobe in the image. "
-        f"Based on the items and accessories visible, what is the best outfit "
-        f"for the following occasion: **{occasion_description}**? "
-        "Suggest a complete look and justify your choices. "
-        "Structure your response with the sections: 'Suggested Outfit', 'Stylist Notes', and 'Visible Items Used'."
-    )
-    
-    # 3. Construct the API Payload for Ollama
-    payload = {
-        "model": MODEL_NAME,
-        "prompt": prompt,
-        "images": [base64_image], # Ollama takes a list of base64 images
-        "stream": False # We want the full response at once
-    }
+    # 1. Decode and encode the image on the shared worker pool, reusing the payload for repeat uploads
+    try:
+        base64_image = get_memory_budget().cached(
+            "payload", f"ollama:{digest(wardrobe_upload)}",
+            lambda: get_image_pool().run(prepare_ollama_payload, wardrobe_upload),
+        )
+    except ImagePoolError as e:
+        return f"⏳ {e}", None
 
     try:
-        # 4. Call the local Ollama server
-        response = requests.post(OLLAMA_API_URL, json=payload, timeout=120)
-        response.raise_for_status() # Raise an exception for bad status codes
-        
-        # 5. Extract the generated text
-        data = response.json()
-        return data.get('response', 'Error: Model response not found.')
+        # 2. Call the local Ollama server with the model tier that fits the current load
+        return generate_with_ollama(base64_image, occasion_description, get_tier_controller(), OLLAMA_API_URL)
         
     except requests.exceptions.ConnectionError:
         return f"🚨 **Connection Error:** Could not connect to Ollama at {OLLAMA_API_URL}. \n\n" \
-               f"Please ensure Ollama is installed, the {MODEL_NAME} model is pulled, and the Ollama application is running on your Mac."
+               f"Please ensure Ollama is installed, the models in your tier ladder are pulled, and the Ollama application is running on your Mac.", None
     except requests.exceptions.RequestException as e:
-        return f"An error occurred during the API call: {e}"
+        return f"An error occurred during the API call: {e}", None
+
+
+def show_suggestion(suggestion: str, served_by: str):
+    """Presents a recommendation in the themed container."""
+    # Use a markdown container to present the final result
+    st.markdown(
+        f'<div style="border: 2px solid #6c62c0; padding: 15px; border-radius: 10px; background-color: #6c62c0;">'
+        f'{suggestion}'
+        f'</div>', 
+        unsafe_allow_html=True
+    )
+    # Record which model tier served this request
+    if served_by:
+        st.caption(f"Served by `{served_by}`")
+
+
+def show_wardrobe_preview(uploaded_file):
+    """
+    Displays a display-sized rendition of the upload, generated once per image and cached,
+    instead of re-encoding and sending the full-resolution photo on every rerun.
+    """
+    wardrobe_upload = uploaded_file.getvalue()
+    try:
+        preview = memory_budget.cached(
+            "image", f"preview:{digest(wardrobe_upload)}",
+            lambda: get_image_pool().run(prepare_preview, wardrobe_upload),
+        )
+    except ImagePoolError as e:
+        st.info(f"⏳ {e}")
+        return
+    # Replaced use_column_width with use_container_width
+    st.image(preview, caption="Your Wardrobe", use_container_width=True)
+    # Deferred: the original is only copied into Streamlit's media storage when the button is clicked
+    st.download_button(
+        "⬇️ Download original",
+        data=uploaded_file.getvalue,
+        file_name=uploaded_file.name,
+        mime=uploaded_file.type,
+        on_click="ignore",
+        width="stretch",
+    )
 
 
 # --- Streamlit UI Layout ---
@@ -144,6 +182,10 @@ st.set_page_config(
 # Inject the custom CSS
 st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
 
+memory_budget = get_memory_budget()
+# Identifies this browser session's entries in the shared memory budget
+session_id = st.session_state.setdefault('session_id', uuid.uuid4().hex)
+
 st.title("🥼 The Muse - now powered by LLaVA")
 st.markdown("Upload your wardrobe photo and tell me the occasion. I'll suggest the perfect outfit!")
 
@@ -178,6 +220,9 @@ with st.sidebar:
         if 'run_generation' not in st.session_state:
              st.session_state['run_generation'] = False
 
+    if diagnostics_enabled():
+        render_diagnostics(memory_budget, get_image_pool(), get_tier_controller())
+
 
 # 2. Main Content Area
 col1, col2 = st.columns([1, 1.5]) # Slightly wider column for the text result
@@ -186,9 +231,7 @@ col1, col2 = st.columns([1, 1.5]) # Slightly wider column for the text result
 with col1:
     st.header("Wardrobe Preview")
     if uploaded_file:
-        wardrobe_image = Image.open(uploaded_file)
-        # Replaced use_column_width with use_container_width
-        st.image(wardrobe_image, caption="Your Wardrobe", use_container_width=True) 
+        show_wardrobe_preview(uploaded_file)
     else:
         st.info("Waiting for image upload. Ensure Ollama is running and LLaVA is pulled!")
 
@@ -198,20 +241,31 @@ with col2:
     
     if st.session_state.get('run_generation', False):
         if uploaded_file and occasion:
-            wardrobe_image_to_process = Image.open(uploaded_file)
+            wardrobe_upload = uploaded_file.getvalue()
             
             # Use a colorful spinner to match the theme
-            with st.spinner(f"Analyzing wardrobe with {MODEL_NAME} and styling the look..."):
-                suggestion = generate_outfit_suggestion_local(wardrobe_image_to_process, occasion)
-                # Use a markdown container to present the final result
-                st.markdown(
-                    f'<div style="border: 2px solid #6c62c0; padding: 15px; border-radius: 10px; background-color: #6c62c0;">'
-                    f'{suggestion}'
-                    f'</div>', 
-                    unsafe_allow_html=True
-                )
+            with st.spinner("Analyzing wardrobe and styling the look..."):
+                generation_started = time.perf_counter()
+                suggestion, served_by = generate_outfit_suggestion_local(wardrobe_upload, occasion)
+                show_suggestion(suggestion, served_by)
+            # Keep the latest result, tagged with the photo and occasion it answers, in the shared
+            # memory budget (not the session) so it can be evicted
+            if served_by:
+                memory_budget.put("result", session_id,
+                                  ((digest(wardrobe_upload), occasion), suggestion, served_by),
+                                  cost=time.perf_counter() - generation_started)
             
             st.session_state['run_generation'] = False
 
         else:
-            st.error("Cannot process: Missing image or occasion description.")
\ No newline at end of file
+            st.error("Cannot process: Missing image or occasion description.")
+    else:
+        # Show the previous recommendation again on reruns, unless it was evicted under memory pressure
+        last_result = memory_budget.get("result", session_id, count_stats=False)
+        if last_result:
+            result_inputs, suggestion, served_by = last_result
+            if uploaded_file and result_inputs == (digest(uploaded_file.getvalue()), occasion):
+                show_suggestion(suggestion, served_by)
+            else:
+                # The photo or occasion changed since, so the old recommendation no longer applies
+                memory_budget.discard("result", session_id)
\ No newline at end of file
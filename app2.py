@@ -3,12 +3,18 @@
 # This app uses Streamlit to create a user interface for an AI-powered fashion stylist powered by Google's Gemini API.
 
 import os
+import time
+import uuid
 import streamlit as st
 from pathlib import Path
-from PIL import Image
-from io import BytesIO  
+from diagnostics import diagnostics_enabled, render_diagnostics
+from memory_budget import MemoryBudget, budget_from_env, digest, start_tracing_from_env
+from image_pool import ImagePoolError, ImageWorkerPool, pool_from_env
+from image_prep import prepare_gemini_payload, prepare_preview
 # You are importing Client and types from google.genai
-from google.genai import Client, types 
+from google.genai import Client
+from generation import DEFAULT_GEMINI_TIERS, generate_with_gemini
+from model_tiers import TierController, load_tier_ladder
 
 # Load environment variables from .env file if it exists
 # IMPORTANT: This must happen BEFORE any Streamlit UI code
@@ -109,94 +115,98 @@ if not GEMINI_API_KEY:
     
     st.stop()
 
+# Ladder of Gemini models, fastest first; gemini-2.5-flash is excellent for multimodal tasks.
+# Defaults to DEFAULT_GEMINI_TIERS in generation.py; override with GEMINI_MODEL_TIERS.
+# Target end-to-end latency; under load the controller drops to smaller tiers to stay within it
+LATENCY_SLO_S = float(os.getenv("MUSE_LATENCY_SLO_S", "20"))
+# Requests the Gemini API serves concurrently for this deployment before latency starts to climb
+GEMINI_CONCURRENCY = int(os.getenv("GEMINI_CONCURRENCY", "8"))
+
+
+@st.cache_resource
+def get_tier_controller() -> TierController:
+    """One controller per process, so tier decisions see the load from every session."""
+    return TierController(
+        load_tier_ladder("GEMINI_MODEL_TIERS", DEFAULT_GEMINI_TIERS),
+        target_latency_s=LATENCY_SLO_S,
+        concurrency=GEMINI_CONCURRENCY,
+    )
+
+
+@st.cache_resource
+def get_image_pool() -> ImageWorkerPool:
+    """One bounded worker pool per process for decoding and encoding every session's uploads."""
+    return pool_from_env()
+
+
+@st.cache_resource
+def get_memory_budget() -> MemoryBudget:
+    """One memory budget per process for every session's cached payloads and results."""
+    start_tracing_from_env()
+    return budget_from_env()
+
+
 # Initialize the Gemini Client
 try:
     # Pass the API key explicitly to the Client
     client = Client(api_key=GEMINI_API_KEY)
-    MODEL_NAME = "gemini-2.5-flash"  # Excellent for multimodal tasks
+    tier_controller = get_tier_controller()
+    image_pool = get_image_pool()
+    memory_budget = get_memory_budget()
 except Exception as e:
     # Use st.exception for better error display in Streamlit
     st.exception(f"Failed to initialize Gemini Client: {e}")
     st.stop()
 
 
-def generate_outfit_suggestion(wardrobe_image: Image.Image, occasion_description: str) -> str:
+def generate_outfit_suggestion(wardrobe_upload: bytes, occasion_description: str) -> tuple[str, str]:
     """
-    Calls the Gemini API to analyze the wardrobe image and suggest an outfit.
-    
-    FIXED: Uses types.Part.from_bytes() to correctly pass the PIL image data.
+    Calls the Gemini API to analyze the uploaded wardrobe image and suggest an outfit.
+    Returns the suggestion and the name of the model tier that served it (None on failure).
     """
     
-    # 1. Define the System Instruction for Role-Playing and better response structure
-    system_instruction = (
-        "You are an expert personal stylist. Your task is to analyze a user's "
-        "wardrobe image and suggest the best possible outfit for a specific occasion. "
-        "Your response MUST be structured, starting with a clear outfit recommendation, "
-        "and then justifying the choice based on the items visible in the image. "
-        "If a perfect item isn't visible, suggest a suitable alternative. "
-        "Be encouraging and concise."
-    )
-    
-    # 2. Construct the User Prompt for the multimodal request
-    user_prompt = (
-        f"Based on the attached image of my wardrobe, what is the best outfit "
-        f"for the following occasion: **{occasion_description}**? "
-        "Please suggest a complete look (main item, accessories, color coordination) "
-        "using only the clothes and accessories visible. "
-        "Structure your response with the sections: 'Suggested Outfit', 'Stylist Notes', and 'Items Used'."
-    )
-    
-    # --- Convert PIL Image to Bytes for the API call ---
-    # Convert images with alpha channel (RGBA, LA) or palette mode (P) to RGB
-    # since JPEG doesn't support transparency
-    image_mode = wardrobe_image.mode
-    if image_mode in ("RGBA", "LA"):
-        # Create a white background and paste the image with alpha channel
-        rgb_image = Image.new("RGB", wardrobe_image.size, (255, 255, 255))
-        rgb_image.paste(wardrobe_image, mask=wardrobe_image.split()[-1])
-        wardrobe_image = rgb_image
-    elif image_mode == "P":
-        # Convert palette mode - check if it has transparency
-        if "transparency" in wardrobe_image.info:
-            # Has transparency, convert to RGBA then to RGB with white background
-            rgba_image = wardrobe_image.convert("RGBA")
-            rgb_image = Image.new("RGB", rgba_image.size, (255, 255, 255))
-            rgb_image.paste(rgba_image, mask=rgba_image.split()[-1])
-            wardrobe_image = rgb_image
-        else:
-            # No transparency, just convert to RGB
-            wardrobe_image = wardrobe_image.convert("RGB")
-    elif image_mode != "RGB":
-        # Convert any other mode (like L grayscale, CMYK, etc.) to RGB
-        wardrobe_image = wardrobe_image.convert("RGB")
-    
-    # Save the image as JPEG into the in-memory byte buffer
-    img_byte_arr = BytesIO()
-    wardrobe_image.save(img_byte_arr, format='JPEG', quality=95) 
-    img_bytes = img_byte_arr.getvalue()
-    
-    # 3. Assemble the Content (Image + Text + Instruction)
-    contents = [
-        # CORRECT WAY: Use from_bytes with the byte data and mime type
-        types.Part.from_bytes(
-            data=img_bytes,
-            mime_type='image/jpeg' 
-        ),
-        user_prompt
-    ]
-    # --- END OF FIX ---
-
+    # --- Convert the upload to JPEG bytes for the API call, on the shared worker pool ---
+    # Flattens alpha/palette/CMYK/grayscale images to RGB since JPEG doesn't support them.
+    # The JPEG is kept in the memory budget so a new occasion for the same photo skips re-encoding.
     try:
-        response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents=contents,
-            config=types.GenerateContentConfig(
-                system_instruction=system_instruction
-            )
+        img_bytes = memory_budget.cached(
+            "payload", f"gemini:{digest(wardrobe_upload)}",
+            lambda: image_pool.run(prepare_gemini_payload, wardrobe_upload),
         )
-        return response.text
+    except ImagePoolError as e:
+        return f"⏳ {e}", None
+
+    try:
+        return generate_with_gemini(client, img_bytes, occasion_description, tier_controller)
     except Exception as e:
-        return f"An error occurred while generating the suggestion: {e}"
+        return f"An error occurred while generating the suggestion: {e}", None
+
+
+def show_wardrobe_preview(uploaded_file):
+    """
+    Displays a display-sized rendition of the upload, generated once per image and cached,
+    instead of re-encoding and sending the full-resolution photo on every rerun.
+    """
+    wardrobe_upload = uploaded_file.getvalue()
+    try:
+        preview = memory_budget.cached(
+            "image", f"preview:{digest(wardrobe_upload)}",
+            lambda: image_pool.run(prepare_preview, wardrobe_upload),
+        )
+    except ImagePoolError as e:
+        st.info(f"⏳ {e}")
+        return
+    # Replaced use_column_width with use_container_width
+    st.image(preview, caption="Your Wardrobe", use_container_width=True)
+    # Deferred: the original is only copied into Streamlit's media storage when the button is clicked
+    st.download_button(
+        "⬇️ Download original",
+        data=uploaded_file.getvalue,
+        file_name=uploaded_file.name,
+        mime=uploaded_file.type,
+        on_click="ignore",
+        width="stretch",
+    )
 
 
 # --- Streamlit UI Layout ---
@@ -362,6 +372,9 @@ st.markdown(
     unsafe_allow_html=True
 )
 
+# Identifies this browser session's entries in the shared memory budget
+session_id = st.session_state.setdefault('session_id', uuid.uuid4().hex)
+
 st.title("🥼 The Muse - now powered by Gemini")
 st.markdown("Upload your wardrobe photo and tell me the occasion. I'll suggest the perfect outfit!")
 
@@ -394,6 +407,9 @@ with st.sidebar:
         if 'run_generation' not in st.session_state:
              st.session_state['run_generation'] = False
 
+    if diagnostics_enabled():
+        render_diagnostics(memory_budget, image_pool, tier_controller)
+
 
 # 2. Main Content Area (Visualization and Output)
 
@@ -403,10 +419,7 @@ col1, col2 = st.columns([1, 1.5])
 with col1:
     st.header("Wardrobe Preview")
     if uploaded_file:
-        # Display the uploaded image
-        wardrobe_image = Image.open(uploaded_file)
-        # Replacing deprecated use_column_width with use_container_width
-        st.image(wardrobe_image, caption="Your Wardrobe", use_container_width=True) 
+        show_wardrobe_preview(uploaded_file)
     else:
         st.info("Waiting for image upload...")
 
@@ -417,19 +430,40 @@ with col2:
     # Run the model when the button is pressed and inputs are valid
     if st.session_state.get('run_generation', False):
         if uploaded_file and occasion:
-            # Re-read the image for the model call
-            wardrobe_image_to_process = Image.open(uploaded_file)
+            # Hand the raw upload to the worker pool, which decodes it for the model call
+            wardrobe_upload = uploaded_file.getvalue()
             
             with st.spinner("Analyzing wardrobe and styling the perfect look..."):
                 # Call the API function
-                suggestion = generate_outfit_suggestion(wardrobe_image_to_process, occasion)
+                generation_started = time.perf_counter()
+                suggestion, served_by = generate_outfit_suggestion(wardrobe_upload, occasion)
                 st.markdown(suggestion) # Display the styled markdown response
+                # Record which model tier served this request
+                if served_by:
+                    st.caption(f"Served by `{served_by}`")
+            # Keep the latest result, tagged with the photo and occasion it answers, in the shared
+            # memory budget (not the session) so it can be evicted
+            if served_by:
+                memory_budget.put("result", session_id,
+                                  ((digest(wardrobe_upload), occasion), suggestion, served_by),
+                                  cost=time.perf_counter() - generation_started)
             
             # Reset state to prevent re-running on every interaction
             st.session_state['run_generation'] = False
 
         else:
             st.error("Cannot process: Missing image or occasion description.")
+    else:
+        # Show the previous recommendation again on reruns, unless it was evicted under memory pressure
+        last_result = memory_budget.get("result", session_id, count_stats=False)
+        if last_result:
+            result_inputs, suggestion, served_by = last_result
+            if uploaded_file and result_inputs == (digest(uploaded_file.getvalue()), occasion):
+                st.markdown(suggestion)
+                st.caption(f"Served by `{served_by}`")
+            else:
+                # The photo or occasion changed since, so the old recommendation no longer applies
+                memory_budget.discard("result", session_id)
 
     # To set your API key, use: export GEMINI_API_KEY="your-api-key-here"
     # Or create a .env file with: GEMINI_API_KEY=your-api-key-here
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the image preparation path (image_prep.py) that runs on every request.
+
+Synthetic wardrobe-like fixtures are generated in memory for several resolutions,
+image modes (RGB, RGBA, P, CMYK, L) and file formats (PNG, JPEG), so the suite runs
+offline with nothing but Pillow installed. Each fixture is pushed through the stages
+
+    decode   - Image.open + load of the uploaded bytes
+    flatten  - mode conversion / alpha flattening to RGB
+    jpeg     - JPEG encode (quality 95, as sent to Gemini)
+    base64   - JPEG encode (quality 75) + base64, as sent to Ollama
+    preview  - decode + downscale + progressive JPEG of the browser preview rendition
+
+and the throughput and latency percentiles of each stage are reported, together with the
+peak resident memory a stage adds on top of its input. Pillow allocates pixel buffers
+outside the Python heap, so memory is measured from the process RSS high-water mark, once
+per stage and fixture in a fresh subprocess so allocator caches from earlier runs don't
+hide the allocation.
+
+Usage:
+    python benchmarks/bench_image_prep.py                          # print results
+    python benchmarks/bench_image_prep.py --save-baseline base.json
+    python benchmarks/bench_image_prep.py --compare base.json      # exit 1 on regression
+
+Baselines are only comparable on the machine (and Pillow version) they were recorded on.
+"""
+import argparse
+import base64
+import gc
+import json
+import math
+import multiprocessing
+import platform
+import random
+import resource
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+
+import PIL
+from PIL import Image, ImageDraw
+
+# Make the app modules importable when running from the benchmarks directory
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from image_prep import encode_jpeg, flatten_to_rgb, make_preview, open_image  # noqa: E402
+
+RESOLUTIONS = {
+    "vga": (640, 480),
+    "1080p": (1920, 1080),
+    "12mp": (4032, 3024),
+}
+MODES = ["RGB", "RGBA", "P", "CMYK", "L"]
+# Modes each upload format can carry: JPEG has no alpha or palette, PNG has no CMYK
+FORMAT_MODES = {
+    "PNG": {"RGB", "RGBA", "P", "L"},
+    "JPEG": {"RGB", "CMYK", "L"},
+}
+STAGES = ["decode", "flatten", "jpeg", "base64", "preview"]
+
+
+# --- Fixtures ---
+def make_wardrobe_image(size: tuple, mode: str, seed: int = 0) -> Image.Image:
+    """
+    Draws a deterministic wardrobe-like picture: coloured garments on a gradient with
+    some texture, so the encoders see realistic rather than flat or pure-noise content.
+    """
+    rng = random.Random(seed)
+    width, height = size
+    image = Image.linear_gradient("L").resize(size).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        x0, y0 = rng.randrange(width), rng.randrange(height)
+        x1 = min(width, x0 + rng.randrange(width // 20, width // 4))
+        y1 = min(height, y0 + rng.randrange(height // 10, height // 2))
+        fill = tuple(rng.randrange(256) for _ in range(3))
+        draw.rectangle([x0, y0, x1, y1], fill=fill)
+    # Low-resolution seeded noise scaled up gives fabric-like texture
+    noise = Image.frombytes("L", (width // 8, height // 8), rng.randbytes((width // 8) * (height // 8)))
+    image = Image.blend(image, noise.resize(size, Image.BICUBIC).convert("RGB"), 0.15)
+
+    if mode == "RGBA":
+        alpha = Image.radial_gradient("L").resize(size)
+        image.putalpha(alpha)
+        return image
+    if mode == "P":
+        image = image.convert("P", palette=Image.ADAPTIVE, colors=256)
+        image.info["transparency"] = 0
+        return image
+    return image.convert(mode)
+
+
+def make_fixture(size: tuple, mode: str, fmt: str) -> bytes:
+    """Encodes a synthetic image the way it would arrive from the file uploader."""
+    buffered = BytesIO()
+    image = make_wardrobe_image(size, mode)
+    if fmt == "PNG" and mode == "P":
+        image.save(buffered, format="PNG", transparency=0)
+    else:
+        image.save(buffered, format=fmt)
+    return buffered.getvalue()
+
+
+def iter_fixtures(resolutions: list):
+    for res_name in resolutions:
+        for mode in MODES:
+            for fmt, fmt_modes in FORMAT_MODES.items():
+                if mode not in fmt_modes:
+                    continue
+                yield f"{res_name}-{mode}-{fmt}", RESOLUTIONS[res_name], mode, fmt
+
+
+# --- Measurement ---
+def percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def stage_functions(data: bytes) -> dict:
+    """Maps each stage to (func, make_input) for one fixture's upload bytes."""
+    decoded = open_image(data)
+    flattened = flatten_to_rgb(decoded)
+    return {
+        "decode": (open_image, lambda: data),
+        "flatten": (flatten_to_rgb, lambda: decoded),
+        "jpeg": (lambda image: encode_jpeg(image, quality=95), lambda: flattened),
+        "base64": (lambda image: base64.b64encode(encode_jpeg(image, quality=75)), lambda: flattened),
+        "preview": (make_preview, lambda: data),
+    }
+
+
+def measure_stage(func, make_input, iterations: int, warmup: int = 2) -> dict:
+    """Times `func(make_input())` and returns throughput and latency percentiles."""
+    for _ in range(warmup):
+        func(make_input())
+
+    timings = []
+    for _ in range(iterations):
+        stage_input = make_input()
+        start = time.perf_counter()
+        func(stage_input)
+        timings.append(time.perf_counter() - start)
+
+    timings.sort()
+    total = sum(timings)
+    return {
+        "iterations": iterations,
+        "throughput_per_s": round(iterations / total, 2) if total else None,
+        "mean_ms": round(total / iterations * 1000, 3),
+        "p50_ms": round(percentile(timings, 50) * 1000, 3),
+        "p95_ms": round(percentile(timings, 95) * 1000, 3),
+        "p99_ms": round(percentile(timings, 99) * 1000, 3),
+    }
+
+
+# --- Peak memory (runs in a fresh subprocess per stage and fixture) ---
+def _read_status_kib(*fields) -> dict:
+    values = {}
+    with open("/proc/self/status") as status:
+        for line in status:
+            name, _, value = line.partition(":")
+            if name in fields:
+                values[name] = int(value.split()[0])
+    return values
+
+
+def _reset_peak_rss() -> bool:
+    """Resets the Linux RSS high-water mark (VmHWM); returns False where that isn't possible."""
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _max_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def stage_peak_rss(data: bytes, stage: str) -> dict:
+    """
+    Peak RSS growth of one stage over its already prepared input, in bytes.
+    On Linux the high-water mark is reset right before the stage runs, so the figure is
+    exact; elsewhere it is the growth of ru_maxrss, which misses peaks that stay below
+    the one reached while preparing the input.
+    """
+    func, make_input = stage_functions(data)[stage]
+    stage_input = make_input()
+    gc.collect()
+    if _reset_peak_rss():
+        before = _read_status_kib("VmRSS")["VmRSS"] * 1024
+        func(stage_input)
+        peak = _read_status_kib("VmHWM")["VmHWM"] * 1024
+        method = "vmhwm"
+    else:
+        before = _max_rss_bytes()
+        func(stage_input)
+        peak = _max_rss_bytes()
+        method = "ru_maxrss"
+    return {"peak_rss_delta_bytes": max(0, peak - before), "memory_method": method}
+
+
+def measure_peak_rss(data: bytes, stages: list) -> dict:
+    """Runs stage_peak_rss for every stage, each in its own freshly spawned process."""
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(processes=1, maxtasksperchild=1) as pool:
+        results = pool.starmap(stage_peak_rss, [(data, stage) for stage in stages])
+    return dict(zip(stages, results))
+
+
+def run_fixture(data: bytes, iterations: int) -> dict:
+    functions = stage_functions(data)
+    width, height = open_image(data).size
+    memory = measure_peak_rss(data, STAGES)
+    results = {}
+    for stage in STAGES:
+        func, make_input = functions[stage]
+        results[stage] = measure_stage(func, make_input, iterations)
+        results[stage]["megapixels_per_s"] = round(results[stage]["throughput_per_s"] * width * height / 1e6, 2)
+        results[stage].update(memory[stage])
+    return results
+
+
+def run_suite(resolutions: list, iterations: int, quiet: bool = False) -> dict:
+    results = {
+        "environment": {
+            "python": platform.python_version(),
+            "pillow": PIL.__version__,
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+        },
+        "fixtures": {},
+    }
+    for name, size, mode, fmt in iter_fixtures(resolutions):
+        data = make_fixture(size, mode, fmt)
+        fixture_result = {"input_bytes": len(data), "stages": run_fixture(data, iterations)}
+        results["fixtures"][name] = fixture_result
+        if not quiet:
+            summary = "  ".join(
+                f"{stage}: p50 {stats['p50_ms']:.2f}ms p95 {stats['p95_ms']:.2f}ms"
+                for stage, stats in fixture_result["stages"].items()
+            )
+            print(f"{name:<18} {summary}", file=sys.stderr)
+    return results
+
+
+# --- Baseline comparison ---
+def latency_limit(base_ms: float, tolerance: float, min_delta_ms: float) -> float:
+    return max(base_ms * (1 + tolerance), base_ms + min_delta_ms)
+
+
+def compare(results: dict, baseline: dict, tolerance: float, memory_tolerance: float,
+            min_delta_ms: float = 1.0, min_delta_bytes: int = 1024 * 1024) -> tuple:
+    """
+    Returns (regressions, warnings) of `results` against `baseline`, each a list of
+    {"fixture", "stage", "metric", "value", "baseline"} dicts.
+    Only the median latency and peak memory can regress: p95 of a few dozen runs is one
+    or two samples, so a single scheduler hiccup would fail the run, and tail slowdowns
+    are reported as warnings instead. A latency only counts as slower when it is both
+    `tolerance` and `min_delta_ms` slower, so sub-millisecond stages don't flap on timer
+    noise; peak memory likewise needs to grow by `memory_tolerance` and `min_delta_bytes`.
+    """
+    regressions, warnings = [], []
+    for name, fixture in results["fixtures"].items():
+        base_fixture = baseline.get("fixtures", {}).get(name)
+        if base_fixture is None:
+            continue
+        for stage, stats in fixture["stages"].items():
+            base = base_fixture["stages"].get(stage)
+            if base is None:
+                continue
+            for metric, found in (("p50_ms", regressions), ("p95_ms", warnings)):
+                if stats[metric] > latency_limit(base[metric], tolerance, min_delta_ms):
+                    found.append({"fixture": name, "stage": stage, "metric": metric,
+                                  "value": stats[metric], "baseline": base[metric]})
+            metric = "peak_rss_delta_bytes"
+            if metric in base:
+                limit = max(base[metric] * (1 + memory_tolerance), base[metric] + min_delta_bytes)
+                if stats[metric] > limit:
+                    regressions.append({"fixture": name, "stage": stage, "metric": metric,
+                                        "value": stats[metric], "baseline": base[metric]})
+    return regressions, warnings
+
+
+def confirm_regressions(regressions: list, iterations: int, tolerance: float, min_delta_ms: float,
+                        retries: int) -> list:
+    """
+    Re-measures each median latency regression `retries` times and keeps only those that
+    are still slower every time, so a burst of background load can't fail a run on its own.
+    Peak memory is measured once per stage in a fresh process and isn't noisy, so it is kept.
+    """
+    confirmed = []
+    for regression in regressions:
+        if regression["metric"] != "p50_ms":
+            confirmed.append(regression)
+            continue
+        res_name, mode, fmt = regression["fixture"].split("-")
+        func, make_input = stage_functions(make_fixture(RESOLUTIONS[res_name], mode, fmt))[regression["stage"]]
+        limit = latency_limit(regression["baseline"], tolerance, min_delta_ms)
+        for _ in range(retries):
+            value = measure_stage(func, make_input, iterations)["p50_ms"]
+            if value <= limit:
+                break
+            regression["value"] = min(regression["value"], value)
+        else:
+            confirmed.append(regression)
+    return confirmed
+
+
+def describe(regression: dict) -> str:
+    value, base = regression["value"], regression["baseline"]
+    if regression["metric"].endswith("_ms"):
+        value, base = f"{value:.3f}", f"{base:.3f}"
+    return f"{regression['fixture']} {regression['stage']} {regression['metric']}: {value} vs baseline {base}"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--resolutions", default=",".join(RESOLUTIONS),
+                        help=f"Comma separated subset of {', '.join(RESOLUTIONS)}")
+    parser.add_argument("--iterations", type=int, default=20, help="Timed runs per stage and fixture")
+    parser.add_argument("--output", help="Write the JSON results to this file instead of stdout")
+    parser.add_argument("--save-baseline", metavar="PATH", help="Save the results as a baseline")
+    parser.add_argument("--compare", metavar="PATH", help="Fail if median latency or peak memory regress against this baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed latency slowdown before a stage counts as regressed (0.25 = 25%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0,
+                        help="Smallest absolute slowdown that can count as a latency regression")
+    parser.add_argument("--memory-tolerance", type=float, default=0.10,
+                        help="Allowed peak memory growth before a stage counts as regressed")
+    parser.add_argument("--min-delta-mb", type=float, default=1.0,
+                        help="Smallest absolute peak memory growth that can count as a regression")
+    parser.add_argument("--retries", type=int, default=2,
+                        help="Re-measurements a median latency regression must survive to count")
+    args = parser.parse_args()
+
+    resolutions = [r.strip() for r in args.resolutions.split(",") if r.strip()]
+    unknown = [r for r in resolutions if r not in RESOLUTIONS]
+    if unknown:
+        parser.error(f"Unknown resolutions: {', '.join(unknown)}")
+
+    results = run_suite(resolutions, args.iterations)
+    output = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    elif not args.save_baseline and not args.compare:
+        print(output)
+
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(output + "\n")
+        print(f"Baseline saved to {args.save_baseline}", file=sys.stderr)
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        regressions, warnings = compare(results, baseline, args.tolerance, args.memory_tolerance, args.min_delta_ms,
+                                        int(args.min_delta_mb * 1024 * 1024))
+        regressions = confirm_regressions(regressions, args.iterations, args.tolerance, args.min_delta_ms,
+                                          args.retries)
+        if warnings:
+            print(f"⚠️  {len(warnings)} tail latency slowdown(s), not counted as regressions:", file=sys.stderr)
+            for warning in warnings:
+                print(f"   {describe(warning)}", file=sys.stderr)
+        if regressions:
+            print(f"❌ {len(regressions)} regression(s) against {args.compare}:", file=sys.stderr)
+            for regression in regressions:
+                print(f"   {describe(regression)}", file=sys.stderr)
+            return 1
+        print(f"✅ No regressions against {args.compare}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
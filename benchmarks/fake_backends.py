@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for Ollama and Gemini used by the load generator (loadgen.py).
+
+FakeOllamaServer speaks enough of Ollama's /api/generate HTTP API (streaming and
+non-streaming) for generation.py, and FakeGeminiClient mimics the parts of
+google.genai.Client that generation.py calls. Both draw their timings from a
+LatencyModel and serve at most `parallel` requests at once, queueing the rest,
+so capacity can be explored without GPUs or network access.
+
+The fake Ollama server can also be run on its own to point app.py at it:
+    python benchmarks/fake_backends.py --port 11434 --model llava:7b=1.0
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+from google.genai import errors as genai_errors
+
+# Words the fake models "generate", so responses look like stylist output
+_VOCABULARY = (
+    "Suggested Outfit: pair the navy blazer with the cream knit and tailored trousers, "
+    "finish with brown loafers and a silver watch. Stylist Notes: the warm neutrals balance "
+    "the cool autumn evening and keep the look semi-formal. Visible Items Used: blazer, "
+    "knit, trousers, loafers, watch."
+).split()
+
+
+class LatencyModel:
+    """
+    Timing model of one generation: time to first token, then a steady token rate.
+
+    Every sample is jittered with a log-normal factor, and `error_rate` of requests fail.
+    A per-model `scale` stretches the time to first token and slows the token rate, so
+    one LatencyModel can describe a whole ladder of model sizes.
+    """
+
+    def __init__(self, ttft_s: float = 0.8, tokens_per_s: float = 30.0, output_tokens: int = 200,
+                 jitter: float = 0.2, error_rate: float = 0.0, seed: int = None):
+        self.ttft_s = ttft_s
+        self.tokens_per_s = tokens_per_s
+        self.output_tokens = output_tokens
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self, scale: float = 1.0) -> dict:
+        with self._lock:
+            factor = self._rng.lognormvariate(0, self.jitter) if self.jitter else 1.0
+            fail = self._rng.random() < self.error_rate
+        return {
+            "ttft_s": self.ttft_s * scale * factor,
+            "token_interval_s": scale * factor / self.tokens_per_s,
+            "tokens": self.output_tokens,
+            "fail": fail,
+        }
+
+
+def fake_tokens(count: int):
+    """Yields `count` space-separated words of stylist-sounding text."""
+    for i in range(count):
+        yield _VOCABULARY[i % len(_VOCABULARY)] + " "
+
+
+class _Backend:
+    """Model registry, latency model and parallel-slot queue shared by both fakes."""
+
+    def __init__(self, models: dict, latency: LatencyModel, parallel: int):
+        self.models = dict(models)
+        self.latency = latency
+        self._slots = threading.Semaphore(max(1, parallel))
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "disconnects": 0, "queue_wait_s": []}
+
+    def acquire(self) -> float:
+        """Waits for a free slot and returns how long the request queued."""
+        start = time.perf_counter()
+        self._slots.acquire()
+        waited = time.perf_counter() - start
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["queue_wait_s"].append(waited)
+        return waited
+
+    def release(self, failed: bool = False, disconnected: bool = False):
+        self._slots.release()
+        with self._lock:
+            if failed:
+                self.stats["errors"] += 1
+            if disconnected:
+                self.stats["disconnects"] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.stats["requests"],
+                "errors": self.stats["errors"],
+                "disconnects": self.stats["disconnects"],
+                "queue_wait_s": list(self.stats["queue_wait_s"]),
+            }
+
+
+# --- Fake Ollama ---
+class FakeOllamaServer:
+    """
+    Threaded HTTP server answering POST /api/generate like Ollama.
+
+    Unknown models get a 404 (like a model that isn't pulled), sampled failures a 500.
+    GET /stats returns the server-side request count, errors, client disconnects and queue waits.
+    """
+
+    def __init__(self, models: dict, latency: LatencyModel, parallel: int = 1,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.backend = _Backend(models, latency, parallel)
+        backend = self.backend
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, body: dict):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path == "/stats":
+                    self._send_json(200, backend.snapshot())
+                else:
+                    self._send_json(404, {"error": "not found"})
+
+            def do_POST(self):
+                if self.path != "/api/generate":
+                    self._send_json(404, {"error": "not found"})
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                model = payload.get("model")
+                if model not in backend.models:
+                    self._send_json(404, {"error": f"model '{model}' not found, try pulling it first"})
+                    return
+
+                timing = backend.latency.sample(backend.models[model])
+                queued_s = backend.acquire()
+                disconnected = False
+                try:
+                    time.sleep(timing["ttft_s"])
+                    if timing["fail"]:
+                        self._send_json(500, {"error": "fake backend failure"})
+                        return
+                    if payload.get("stream", True):
+                        self._stream(model, timing)
+                    else:
+                        time.sleep(timing["token_interval_s"] * timing["tokens"])
+                        text = "".join(fake_tokens(timing["tokens"]))
+                        self._send_json(200, {"model": model, "response": text, "done": True,
+                                              "queue_duration": int(queued_s * 1e9)})
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client timed out or went away; stop answering instead of logging a traceback
+                    disconnected = True
+                    self.close_connection = True
+                finally:
+                    backend.release(failed=timing["fail"], disconnected=disconnected)
+
+            def _stream(self, model: str, timing: dict):
+                # HTTP/1.0 without Content-Length: the body ends when the connection closes
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.end_headers()
+                for i, token in enumerate(fake_tokens(timing["tokens"])):
+                    if i:
+                        time.sleep(timing["token_interval_s"])
+                    self.wfile.write(json.dumps({"model": model, "response": token, "done": False}).encode() + b"\n")
+                    self.wfile.flush()
+                self.wfile.write(json.dumps({"model": model, "response": "", "done": True}).encode() + b"\n")
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/api/generate"
+
+    def start(self) -> "FakeOllamaServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+# --- Fake Gemini ---
+class FakeGeminiClient:
+    """
+    Drop-in for google.genai.Client as used by generation.py.
+
+    Failures raise google.genai.errors.ServerError and unknown models ClientError(404),
+    the same exception types the real client raises. Requests whose sampled latency
+    exceeds `timeout_s` wait out the timeout and raise TimeoutError.
+    """
+
+    def __init__(self, models: dict, latency: LatencyModel, parallel: int = 8, timeout_s: float = None):
+        self.backend = _Backend(models, latency, parallel)
+        self.timeout_s = timeout_s
+        self.models = SimpleNamespace(
+            generate_content=self._generate_content,
+            generate_content_stream=self._generate_content_stream,
+        )
+
+    def _generate(self, model: str):
+        """Yields text pieces on the fake model's schedule."""
+        if model not in self.backend.models:
+            raise genai_errors.ClientError(404, {"error": {"code": 404, "status": "NOT_FOUND",
+                                                           "message": f"models/{model} is not found"}})
+        timing = self.backend.latency.sample(self.backend.models[model])
+        start = time.perf_counter()
+        self.backend.acquire()
+        failed = True
+        try:
+            total_s = timing["ttft_s"] + timing["token_interval_s"] * timing["tokens"]
+            if self.timeout_s is not None and (time.perf_counter() - start) + total_s > self.timeout_s:
+                time.sleep(max(0.0, self.timeout_s - (time.perf_counter() - start)))
+                raise TimeoutError(f"fake Gemini request timed out after {self.timeout_s}s")
+            time.sleep(timing["ttft_s"])
+            if timing["fail"]:
+                raise genai_errors.ServerError(503, {"error": {"code": 503, "status": "UNAVAILABLE",
+                                                               "message": "fake backend failure"}})
+            for i, token in enumerate(fake_tokens(timing["tokens"])):
+                if i:
+                    time.sleep(timing["token_interval_s"])
+                yield token
+            failed = False
+        finally:
+            self.backend.release(failed=failed)
+
+    def _generate_content(self, model: str, contents=None, config=None):
+        return SimpleNamespace(text="".join(self._generate(model)))
+
+    def _generate_content_stream(self, model: str, contents=None, config=None):
+        for token in self._generate(model):
+            yield SimpleNamespace(text=token)
+
+
+def parse_models(specs: list) -> dict:
+    """Parses ["llava:7b=1.0", "llava:13b"] into {model: latency scale}."""
+    models = {}
+    for spec in specs:
+        name, sep, scale = spec.rpartition("=")
+        if not sep:
+            name, scale = spec, "1.0"
+        models[name] = float(scale)
+    return models
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Ollama server for local testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--model", action="append", default=[],
+                        help="<name>=<latency scale>; repeat for each model the server should know")
+    parser.add_argument("--parallel", type=int, default=1, help="Requests served at once (OLLAMA_NUM_PARALLEL)")
+    parser.add_argument("--ttft", type=float, default=0.8, help="Seconds to first token at scale 1.0")
+    parser.add_argument("--tokens-per-s", type=float, default=30.0)
+    parser.add_argument("--output-tokens", type=int, default=200)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    latency = LatencyModel(args.ttft, args.tokens_per_s, args.output_tokens, args.jitter, args.error_rate)
+    server = FakeOllamaServer(parse_models(args.model or ["llava:7b"]), latency, args.parallel, args.host, args.port)
+    print(f"Fake Ollama listening on {server.url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Open-loop load generator for the generation layer (generation.py).
+
+Replays a JSONL trace of requests against a bundled fake Ollama server or fake Gemini
+client (fake_backends.py) at a fixed arrival rate, regardless of how fast earlier
+requests complete, and reports throughput, latency / time-to-first-token / queueing
+delay percentiles, error and timeout rates, and which model tiers served the load.
+Every request goes through the same image preparation and tier controller as the apps.
+
+Each trace line is a JSON object; the occasion text is read from "occasion", "prompt",
+"body" or "title" (so requests.jsonl works as-is), and an optional "arrival_s" offset
+is used with --trace-timing.
+
+Usage:
+    python benchmarks/loadgen.py --trace requests.jsonl --rate 2 --duration 60
+    python benchmarks/loadgen.py --backend gemini --rate 20 --requests 500 --stream
+    python benchmarks/loadgen.py --rate 1 --model llava:7b=0.5 --parallel 4 --slo 10
+
+Latency, TTFT and queueing delay are measured from each request's scheduled arrival.
+Without --stream the apps' non-streaming calls are used, so TTFT equals latency.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+# Make the app modules importable when running from the benchmarks directory
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_image_prep import RESOLUTIONS, make_fixture, percentile  # noqa: E402
+from fake_backends import FakeGeminiClient, FakeOllamaServer, LatencyModel, parse_models  # noqa: E402
+from generation import DEFAULT_GEMINI_TIERS, DEFAULT_OLLAMA_TIERS, generate_with_gemini, generate_with_ollama  # noqa: E402
+from image_pool import ImageWorkerPool  # noqa: E402
+from image_prep import prepare_gemini_payload, prepare_ollama_payload  # noqa: E402
+from model_tiers import TierController, parse_tier_ladder  # noqa: E402
+
+DEFAULT_OCCASION = "A semi-formal evening dinner party on a cool autumn night."
+OCCASION_FIELDS = ("occasion", "prompt", "body", "title")
+
+
+# --- Trace and arrivals ---
+def load_trace(path: str) -> list:
+    """Reads trace records, keeping the occasion text and optional arrival offset."""
+    records = []
+    with open(path, "r") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{line_number}: invalid JSON ({e})")
+            occasion = next((item[k] for k in OCCASION_FIELDS if item.get(k)), DEFAULT_OCCASION)
+            records.append({"occasion": occasion, "arrival_s": item.get("arrival_s")})
+    if not records:
+        raise ValueError(f"{path} contains no requests")
+    return records
+
+
+def schedule_arrivals(trace: list, count: int, rate: float, poisson: bool, trace_timing: bool,
+                      seed: int) -> list:
+    """Returns (arrival offset in seconds, occasion) pairs, cycling the trace as needed."""
+    if trace_timing:
+        if any(record["arrival_s"] is None for record in trace):
+            raise ValueError("--trace-timing needs an arrival_s on every trace line")
+        return sorted((float(r["arrival_s"]), r["occasion"]) for r in trace)[:count]
+
+    rng = random.Random(seed)
+    arrivals, offset = [], 0.0
+    for i in range(count):
+        arrivals.append((offset, trace[i % len(trace)]["occasion"]))
+        offset += rng.expovariate(rate) if poisson else 1.0 / rate
+    return arrivals
+
+
+# --- Request execution ---
+class Target:
+    """The fake backend plus the tier controller and call used for every request."""
+
+    def __init__(self, args):
+        ladder = parse_tier_ladder(args.tiers or (DEFAULT_OLLAMA_TIERS if args.backend == "ollama" else DEFAULT_GEMINI_TIERS))
+        latency = LatencyModel(args.ttft, args.tokens_per_s, args.output_tokens, args.jitter,
+                               args.error_rate, seed=args.seed)
+        if args.model:
+            models = parse_models(args.model)
+        else:
+            # Scale each fake model so that its mean latency matches the ladder's expectation
+            base_s = args.ttft + args.output_tokens / args.tokens_per_s
+            models = {tier.name: tier.expected_latency_s / base_s for tier in ladder}
+
+        parallel = args.parallel or (1 if args.backend == "ollama" else 8)
+        self.controller = TierController(ladder, target_latency_s=args.slo, concurrency=parallel)
+        self.backend_name = args.backend
+        self.stream = args.stream
+        self.timeout = args.timeout
+        self.image_pool = None if args.image_pool == "none" else ImageWorkerPool(args.image_pool, args.image_workers)
+        if args.backend == "ollama":
+            self.server = FakeOllamaServer(models, latency, parallel).start()
+            self.backend = self.server.backend
+            self.client = None
+        else:
+            self.server = None
+            self.client = FakeGeminiClient(models, latency, parallel, timeout_s=args.timeout)
+            self.backend = self.client.backend
+
+    def prepare(self, prepare_func, upload: bytes):
+        if self.image_pool:
+            return self.image_pool.run(prepare_func, upload)
+        return prepare_func(upload)
+
+    def call(self, upload: bytes, occasion: str, on_token) -> str:
+        """Prepares the upload like the app does and returns the model that served it."""
+        if self.backend_name == "ollama":
+            base64_image = self.prepare(prepare_ollama_payload, upload)
+            _, model = generate_with_ollama(base64_image, occasion, self.controller, self.server.url,
+                                            timeout=self.timeout, stream=self.stream, on_token=on_token)
+        else:
+            jpeg_bytes = self.prepare(prepare_gemini_payload, upload)
+            _, model = generate_with_gemini(self.client, jpeg_bytes, occasion, self.controller,
+                                            stream=self.stream, on_token=on_token)
+        return model
+
+    def close(self):
+        if self.server:
+            self.server.stop()
+        if self.image_pool:
+            self.image_pool.shutdown()
+
+
+def run_request(target: Target, upload: bytes, occasion: str, scheduled_at: float) -> dict:
+    started = time.perf_counter()
+    first_token = []
+
+    def on_token(_piece):
+        if not first_token:
+            first_token.append(time.perf_counter())
+
+    result = {"queue_delay_s": started - scheduled_at, "model": None}
+    try:
+        result["model"] = target.call(upload, occasion, on_token)
+        result["status"] = "ok"
+    except (requests.exceptions.Timeout, TimeoutError):
+        result["status"] = "timeout"
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = f"{type(e).__name__}: {e}"
+    finished = time.perf_counter()
+    result["latency_s"] = finished - scheduled_at
+    result["ttft_s"] = first_token[0] - scheduled_at if first_token else None
+    result["finished_at"] = finished
+    return result
+
+
+def run_load(target: Target, arrivals: list, upload: bytes, max_workers: int) -> tuple:
+    """Submits every request at its scheduled time and waits for all of them."""
+    futures = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        t0 = time.perf_counter()
+        for offset, occasion in arrivals:
+            delay = t0 + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(pool.submit(run_request, target, upload, occasion, t0 + offset))
+        results = [future.result() for future in futures]
+    return results, t0
+
+
+# --- Reporting ---
+def summarize(values: list) -> dict:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "mean": None, "max": None}
+    values = sorted(values)
+    return {
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "p99": round(percentile(values, 99), 3),
+        "mean": round(sum(values) / len(values), 3),
+        "max": round(values[-1], 3),
+    }
+
+
+def build_report(results: list, t0: float, arrivals: list, target: Target, args) -> dict:
+    ok = [r for r in results if r["status"] == "ok"]
+    statuses = Counter(r["status"] for r in results)
+    wall_s = max(r["finished_at"] for r in results) - t0
+    span_s = arrivals[-1][0] if len(arrivals) > 1 else 0.0
+    server = target.backend.snapshot()
+    errors = Counter(r["error"] for r in results if r["status"] == "error")
+    return {
+        "backend": args.backend,
+        "stream": args.stream,
+        "slo_s": args.slo,
+        "requests": len(results),
+        "offered_rate_rps": round((len(arrivals) - 1) / span_s, 3) if span_s else None,
+        "wall_time_s": round(wall_s, 3),
+        "throughput_rps": round(len(ok) / wall_s, 3) if wall_s else None,
+        "success_rate": round(len(ok) / len(results), 4),
+        "error_rate": round(statuses["error"] / len(results), 4),
+        "timeout_rate": round(statuses["timeout"] / len(results), 4),
+        "slo_attainment": round(sum(r["latency_s"] <= args.slo for r in ok) / len(results), 4),
+        "latency_s": summarize([r["latency_s"] for r in ok]),
+        "ttft_s": summarize([r["ttft_s"] for r in ok if r["ttft_s"] is not None]),
+        "queue_delay_s": summarize([r["queue_delay_s"] for r in results]),
+        "backend_queue_wait_s": summarize(server["queue_wait_s"]),
+        "backend_disconnects": server["disconnects"],
+        "tiers": dict(Counter(r["model"] for r in ok)),
+        "image_pool": target.image_pool.snapshot() if target.image_pool else None,
+        "top_errors": dict(errors.most_common(5)),
+    }
+
+
+def print_report(report: dict):
+    def fmt(stats: dict) -> str:
+        if stats["p50"] is None:
+            return "n/a"
+        return f"p50 {stats['p50']:.2f}s  p95 {stats['p95']:.2f}s  p99 {stats['p99']:.2f}s"
+
+    print("=" * 70, file=sys.stderr)
+    print(f"Backend: {report['backend']} (stream={report['stream']}, SLO {report['slo_s']}s)", file=sys.stderr)
+    print(f"Requests: {report['requests']}  offered {report['offered_rate_rps']} req/s  "
+          f"throughput {report['throughput_rps']} req/s", file=sys.stderr)
+    print(f"Success {report['success_rate']:.1%}  errors {report['error_rate']:.1%}  "
+          f"timeouts {report['timeout_rate']:.1%}  within SLO {report['slo_attainment']:.1%}", file=sys.stderr)
+    print(f"Latency:        {fmt(report['latency_s'])}", file=sys.stderr)
+    print(f"TTFT:           {fmt(report['ttft_s'])}", file=sys.stderr)
+    print(f"Queueing delay: {fmt(report['queue_delay_s'])}", file=sys.stderr)
+    print(f"Backend queue:  {fmt(report['backend_queue_wait_s'])}  "
+          f"client disconnects {report['backend_disconnects']}", file=sys.stderr)
+    print(f"Tiers served:   {report['tiers']}", file=sys.stderr)
+    if report["image_pool"]:
+        print(f"Image pool:     {report['image_pool']}", file=sys.stderr)
+    for error, count in report["top_errors"].items():
+        print(f"   {count}x {error}", file=sys.stderr)
+    print("=" * 70, file=sys.stderr)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backend", choices=["ollama", "gemini"], default="ollama")
+    parser.add_argument("--trace", help="JSONL trace to replay (defaults to a single built-in occasion)")
+    parser.add_argument("--rate", type=float, default=1.0, help="Arrival rate in requests per second")
+    parser.add_argument("--duration", type=float, help="Seconds of arrivals to generate (sets --requests)")
+    parser.add_argument("--requests", type=int, default=50, help="Number of requests to send")
+    parser.add_argument("--uniform", action="store_true", help="Evenly spaced instead of Poisson arrivals")
+    parser.add_argument("--trace-timing", action="store_true", help="Use the trace's arrival_s offsets")
+    parser.add_argument("--stream", action="store_true", help="Stream responses to measure real TTFT")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-request timeout in seconds")
+    parser.add_argument("--max-workers", type=int, default=256, help="Client threads (concurrent sessions)")
+    parser.add_argument("--image-size", choices=list(RESOLUTIONS), default="1080p")
+    parser.add_argument("--image", help="Upload this image file instead of a synthetic wardrobe PNG")
+    parser.add_argument("--image-pool", choices=["none", "thread", "process"], default="thread",
+                        help="Prepare images on a shared worker pool like the apps do")
+    parser.add_argument("--image-workers", type=int, help="Workers in the image pool")
+    # Tiering
+    parser.add_argument("--tiers", help="Model ladder spec (defaults to the app's ladder for the backend)")
+    parser.add_argument("--slo", type=float, default=20.0, help="Target latency in seconds")
+    # Fake backend latency model
+    parser.add_argument("--model", action="append", default=[],
+                        help="<name>=<latency scale> served by the fake backend (default: the ladder)")
+    parser.add_argument("--parallel", type=int, help="Requests the fake backend serves at once")
+    parser.add_argument("--ttft", type=float, default=0.8, help="Seconds to first token at scale 1.0")
+    parser.add_argument("--tokens-per-s", type=float, default=30.0)
+    parser.add_argument("--output-tokens", type=int, default=200)
+    parser.add_argument("--jitter", type=float, default=0.2, help="Log-normal sigma of latency noise")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    if args.rate <= 0:
+        parser.error("--rate must be positive")
+    count = int(args.duration * args.rate) if args.duration else args.requests
+    trace = load_trace(args.trace) if args.trace else [{"occasion": DEFAULT_OCCASION, "arrival_s": None}]
+    arrivals = schedule_arrivals(trace, max(1, count), args.rate, not args.uniform, args.trace_timing, args.seed)
+    upload = Path(args.image).read_bytes() if args.image else make_fixture(RESOLUTIONS[args.image_size], "RGB", "PNG")
+
+    target = Target(args)
+    try:
+        results, t0 = run_load(target, arrivals, upload, args.max_workers)
+    finally:
+        target.close()
+
+    report = build_report(results, t0, arrivals, target, args)
+    print_report(report)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
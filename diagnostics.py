@@ -0,0 +1,46 @@
+# diagnostics.py
+
+# Sidebar diagnostics view shared by app.py and app2.py, shown when MUSE_DIAGNOSTICS is set.
+# Summarizes the process-wide memory budget, tracemalloc allocation sites, the image worker pool
+# and the model tier controller, which are all shared by every session of the process.
+
+import os
+import streamlit as st
+from memory_budget import format_bytes, peak_rss_bytes, tracemalloc_breakdown
+
+
+def diagnostics_enabled() -> bool:
+    return os.getenv("MUSE_DIAGNOSTICS", "").lower() in ("1", "true", "yes")
+
+
+def render_diagnostics(budget, image_pool=None, tier_controller=None):
+    """Renders the diagnostics expander for the process-wide shared resources."""
+    with st.expander("🧠 Diagnostics", expanded=False):
+        usage = budget.snapshot()
+        st.write(f"**Memory budget:** {format_bytes(usage['used_bytes'])} of {format_bytes(usage['limit_bytes'])} "
+                 f"in {usage['entries']} entries")
+        st.write(f"**Peak RSS:** {format_bytes(peak_rss_bytes())}")
+        st.table([
+            {"category": name, "entries": stats["entries"], "size": format_bytes(stats["bytes"])}
+            for name, stats in usage["categories"].items()
+        ])
+        st.caption(f"Hits {usage['hits']} · misses {usage['misses']} · evictions {usage['evictions']} · "
+                   f"too large {usage['rejected']}")
+
+        breakdown = tracemalloc_breakdown()
+        if breakdown is None:
+            st.caption("Set MUSE_TRACEMALLOC=1 (or a frame count) to see Python allocation sites.")
+        else:
+            st.write(f"**Python heap (tracemalloc):** {format_bytes(breakdown['traced_bytes'])} "
+                     f"(peak {format_bytes(breakdown['traced_peak_bytes'])})")
+            st.table([
+                {"where": item["where"], "size": format_bytes(item["bytes"]), "blocks": item["blocks"]}
+                for item in breakdown["top"]
+            ])
+
+        if image_pool is not None:
+            st.write("**Image worker pool**")
+            st.json(image_pool.snapshot(), expanded=False)
+        if tier_controller is not None:
+            st.write("**Model tiers**")
+            st.json(tier_controller.snapshot(), expanded=False)
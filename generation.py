@@ -0,0 +1,156 @@
+# generation.py
+
+# Generation layer shared by the Ollama (app.py) and Gemini (app2.py) stylists and the load generator.
+# Builds the stylist prompts, picks a model tier through the TierController and calls the backend.
+# Backend errors are raised to the caller: the apps turn them into friendly messages and the
+# load generator counts them.
+
+import json
+import requests
+from google.genai import types
+from google.genai import errors as genai_errors
+from model_tiers import TierController
+
+# Ollama runs a local server at this address by default
+OLLAMA_API_URL = "http://localhost:11434/api/generate"
+
+# Default model ladders, fastest first: "<model>=<expected seconds per request>,..."
+DEFAULT_OLLAMA_TIERS = "moondream:1.8b=5,llava:7b=15,llava:13b=40"
+DEFAULT_GEMINI_TIERS = "gemini-2.5-flash-lite=4,gemini-2.5-flash=10"
+
+GEMINI_SYSTEM_INSTRUCTION = (
+    "You are an expert personal stylist. Your task is to analyze a user's "
+    "wardrobe image and suggest the best possible outfit for a specific occasion. "
+    "Your response MUST be structured, starting with a clear outfit recommendation, "
+    "and then justifying the choice based on the items visible in the image. "
+    "If a perfect item isn't visible, suggest a suitable alternative. "
+    "Be encouraging and concise."
+)
+
+
+def build_ollama_prompt(occasion_description: str) -> str:
+    """User prompt for the local VLM, which gets no separate system instruction."""
+    return (
+        f"You are an expert personal stylist. Analyze the entire wardrobe in the image. "
+        f"Based on the items and accessories visible, what is the best outfit "
+        f"for the following occasion: **{occasion_description}**? "
+        "Suggest a complete look and justify your choices. "
+        "Structure your response with the sections: 'Suggested Outfit', 'Stylist Notes', and 'Visible Items Used'."
+    )
+
+
+def build_gemini_prompt(occasion_description: str) -> str:
+    """User prompt for the multimodal Gemini request."""
+    return (
+        f"Based on the attached image of my wardrobe, what is the best outfit "
+        f"for the following occasion: **{occasion_description}**? "
+        "Please suggest a complete look (main item, accessories, color coordination) "
+        "using only the clothes and accessories visible. "
+        "Structure your response with the sections: 'Suggested Outfit', 'Stylist Notes', and 'Items Used'."
+    )
+
+
+def _call_ollama(api_url: str, payload: dict, timeout: float, on_token=None) -> str:
+    """Posts one request to Ollama and returns the full response text."""
+    stream = payload["stream"]
+    response = requests.post(api_url, json=payload, timeout=timeout, stream=stream)
+    response.raise_for_status() # Raise an exception for bad status codes
+
+    if not stream:
+        text = response.json().get('response', 'Error: Model response not found.')
+        if on_token:
+            on_token(text)
+        return text
+
+    # Streaming responses are newline-delimited JSON chunks, the last one has "done": true
+    parts = []
+    for line in response.iter_lines():
+        if not line:
+            continue
+        chunk = json.loads(line)
+        if "error" in chunk:
+            raise requests.exceptions.RequestException(chunk["error"])
+        piece = chunk.get("response", "")
+        if piece:
+            parts.append(piece)
+            if on_token:
+                on_token(piece)
+        if chunk.get("done"):
+            break
+    return "".join(parts)
+
+
+def generate_with_ollama(base64_image: str, occasion_description: str, controller: TierController,
+                         api_url: str = OLLAMA_API_URL, timeout: float = 120,
+                         stream: bool = False, on_token=None) -> tuple[str, str]:
+    """
+    Asks the Ollama tier chosen by `controller` for an outfit suggestion.
+
+    Returns the suggestion and the model that served it. `on_token` is called with each
+    piece of text as it arrives (once with the whole answer when not streaming).
+    Raises requests exceptions on failure; tiers whose model isn't pulled are skipped.
+    """
+    prompt = build_ollama_prompt(occasion_description)
+    while True:
+        # Pick a model tier for the current load and construct the API Payload for Ollama
+        with controller.serve() as decision:
+            payload = {
+                "model": decision["model"],
+                "prompt": prompt,
+                "images": [base64_image], # Ollama takes a list of base64 images
+                "stream": stream,
+            }
+            try:
+                return _call_ollama(api_url, payload, timeout, on_token), decision["model"]
+            except requests.exceptions.Timeout:
+                # Counts against the tier's latency estimate, unlike other failures
+                decision["timed_out"] = True
+                raise
+            except requests.exceptions.HTTPError as e:
+                # Ollama answers 404 for models that are not pulled: skip that tier and try another one
+                if e.response is not None and e.response.status_code == 404 and controller.mark_unavailable(decision["tier"]):
+                    decision["ok"] = False
+                    continue
+                raise
+
+
+def generate_with_gemini(client, jpeg_bytes: bytes, occasion_description: str, controller: TierController,
+                         stream: bool = False, on_token=None) -> tuple[str, str]:
+    """
+    Asks the Gemini tier chosen by `controller` for an outfit suggestion.
+
+    Returns the suggestion and the model that served it. `on_token` is called with each
+    piece of text as it arrives (once with the whole answer when not streaming).
+    Raises the client's exceptions on failure; unknown models are skipped.
+    """
+    # Assemble the Content (Image + Text); from_bytes takes the JPEG data and its mime type
+    contents = [
+        types.Part.from_bytes(data=jpeg_bytes, mime_type='image/jpeg'),
+        build_gemini_prompt(occasion_description),
+    ]
+    config = types.GenerateContentConfig(system_instruction=GEMINI_SYSTEM_INSTRUCTION)
+
+    while True:
+        # Pick a model tier for the current load
+        with controller.serve() as decision:
+            model_name = decision["model"]
+            try:
+                if not stream:
+                    text = client.models.generate_content(model=model_name, contents=contents, config=config).text
+                    if on_token:
+                        on_token(text)
+                    return text, model_name
+
+                parts = []
+                for chunk in client.models.generate_content_stream(model=model_name, contents=contents, config=config):
+                    if chunk.text:
+                        parts.append(chunk.text)
+                        if on_token:
+                            on_token(chunk.text)
+                return "".join(parts), model_name
+            except genai_errors.APIError as e:
+                # Unknown or retired model: skip that tier and try another one
+                if e.code == 404 and controller.mark_unavailable(decision["tier"]):
+                    decision["ok"] = False
+                    continue
+                raise
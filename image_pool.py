@@ -0,0 +1,227 @@
+# image_pool.py
+
+# Shared, bounded worker pool for CPU-heavy image preparation.
+# Streamlit runs every session's script in a thread of one process, so without a shared limit
+# concurrent uploads decode/convert/encode all at once and stall every session's UI. All image
+# preparation goes through one ImageWorkerPool per process: a fixed number of workers, a bounded
+# number of admitted tasks, per-task timeouts and metrics. In the "process" variant, upload bytes
+# (what the apps pass) are pickled to the workers like any other argument; only callers that pass
+# an already decoded PIL image have its pixel buffer handed over through shared memory.
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from multiprocessing import get_context, shared_memory
+from PIL import Image
+
+
+class ImagePoolError(Exception):
+    """Base class for image pool failures that the UI reports as 'busy, try again'."""
+
+
+class ImagePoolBusyError(ImagePoolError):
+    """Raised when no task slot frees up within the queue timeout."""
+
+
+class ImageTaskTimeoutError(ImagePoolError, TimeoutError):
+    """Raised when a task doesn't finish within the task timeout."""
+
+
+# --- Worker side ---
+def _run_task(func, item) -> tuple:
+    """Runs a task and returns (result, started, finished) wall-clock times seen by the worker."""
+    started = time.time()
+    result = func(item)
+    return result, started, time.time()
+
+
+# --- Shared-memory handoff of decoded images (process pool) ---
+def _describe_image(image: Image.Image) -> dict:
+    """Metadata needed to rebuild a PIL image from its raw pixel buffer."""
+    meta = {"mode": image.mode, "size": image.size, "info": {}}
+    if image.mode == "P":
+        palette_mode = image.palette.mode
+        meta["palette"] = (palette_mode, image.getpalette(palette_mode))
+    if "transparency" in image.info:
+        meta["info"]["transparency"] = image.info["transparency"]
+    return meta
+
+
+def _export(image: Image.Image) -> tuple:
+    """Copies an image's pixels into a new shared memory block."""
+    meta, data = _describe_image(image), image.tobytes()
+    meta["length"] = len(data)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    shm.buf[:len(data)] = data
+    return shm, meta
+
+
+def _import(shm_name: str, meta: dict) -> Image.Image:
+    """Rebuilds the image inside a worker process, copying the pixels straight into Pillow."""
+    # Workers share the parent's resource tracker, so the parent's unlink is the only cleanup needed
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        view = shm.buf[:meta["length"]]
+        try:
+            image = Image.frombytes(meta["mode"], tuple(meta["size"]), view)
+        finally:
+            view.release()
+        if "palette" in meta:
+            palette_mode, palette = meta["palette"]
+            image.putpalette(palette, rawmode=palette_mode)
+        image.info.update(meta["info"])
+        return image
+    finally:
+        shm.close()
+
+
+def _run_shared(func, shm_name: str, meta: dict) -> tuple:
+    """Worker-process entry point for shared images; attaching the pixels counts as run time."""
+    started = time.time()
+    result = func(_import(shm_name, meta))
+    return result, started, time.time()
+
+
+# --- Pool ---
+class ImageWorkerPool:
+    """
+    Runs image preparation tasks on a fixed set of workers shared by every session.
+
+    At most `max_pending` tasks are admitted at once (running or queued); callers wait up
+    to `queue_timeout_s` for a slot and get ImagePoolBusyError otherwise, so a burst of
+    large uploads degrades into "busy" messages instead of unbounded CPU contention.
+    Once admitted, a task that hasn't returned within `task_timeout_s` raises
+    ImageTaskTimeoutError to the caller; the deadline includes waiting for a free worker.
+
+    Metrics separate the three phases of a task: waiting for admission, waiting in the
+    executor for a worker, and running, the last two as timed inside the worker.
+    """
+
+    def __init__(self, kind: str = "thread", max_workers: int = None, max_pending: int = None,
+                 task_timeout_s: float = 30.0, queue_timeout_s: float = 5.0, window: int = 200):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown image pool kind {kind!r}; use 'thread' or 'process'.")
+        self.kind = kind
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.max_pending = max_pending or self.max_workers * 4
+        self.task_timeout_s = task_timeout_s
+        self.queue_timeout_s = queue_timeout_s
+        if kind == "process":
+            # Spawned workers don't inherit Streamlit's threads or locks
+            self._executor = ProcessPoolExecutor(self.max_workers, mp_context=get_context("spawn"))
+        else:
+            self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="image-worker")
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._counters = {"submitted": 0, "completed": 0, "failed": 0, "timed_out": 0, "rejected": 0}
+        self._in_flight = 0
+        self._admission_wait_s = deque(maxlen=window)
+        self._worker_wait_s = deque(maxlen=window)
+        self._run_time_s = deque(maxlen=window)
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def run(self, func, item):
+        """
+        Runs `func(item)` on the pool and returns its result.
+
+        `item` is upload bytes or a PIL image; `func` must be a module-level function
+        (e.g. from image_prep) so the process variant can send it to a worker.
+        """
+        waiting_since = time.perf_counter()
+        if not self._slots.acquire(timeout=self.queue_timeout_s):
+            self._count("rejected")
+            raise ImagePoolBusyError("The stylist is busy preparing other uploads. Please try again in a moment.")
+
+        admission_wait_s = time.perf_counter() - waiting_since
+        shm = None
+        try:
+            if self.kind == "process" and isinstance(item, Image.Image):
+                shm, meta = _export(item)
+                submitted_at = time.time()
+                future = self._executor.submit(_run_shared, func, shm.name, meta)
+            else:
+                submitted_at = time.time()
+                future = self._executor.submit(_run_task, func, item)
+        except BaseException:
+            self._slots.release()
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+            raise
+        with self._lock:
+            self._counters["submitted"] += 1
+            self._in_flight += 1
+            self._admission_wait_s.append(admission_wait_s)
+        future.add_done_callback(lambda f: self._finish(f, shm, submitted_at))
+
+        try:
+            result, _, _ = future.result(timeout=self.task_timeout_s)
+        except FutureTimeoutError:
+            # A task that hasn't started yet is dropped; a running one finishes in the background
+            future.cancel()
+            self._count("timed_out")
+            raise ImageTaskTimeoutError(
+                f"Preparing the image took longer than {self.task_timeout_s:g}s. Please try a smaller photo."
+            )
+        return result
+
+    def _finish(self, future, shm, submitted_at: float):
+        """Frees the task slot (and shared memory) once the worker is really done with it."""
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+        with self._lock:
+            self._in_flight -= 1
+            if future.cancelled() or future.exception() is not None:
+                self._counters["failed"] += 1
+            else:
+                self._counters["completed"] += 1
+                _, started, finished = future.result()
+                self._worker_wait_s.append(max(0.0, started - submitted_at))
+                self._run_time_s.append(finished - started)
+        self._slots.release()
+
+    def snapshot(self) -> dict:
+        """Counters and recent timing percentiles for diagnostics."""
+        def pct(values, q):
+            if not values:
+                return None
+            values = sorted(values)
+            return round(values[min(len(values) - 1, int(q * len(values)))], 4)
+
+        with self._lock:
+            return {
+                "kind": self.kind,
+                "max_workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "in_flight": self._in_flight,
+                **self._counters,
+                "admission_wait_p50_s": pct(self._admission_wait_s, 0.50),
+                "admission_wait_p95_s": pct(self._admission_wait_s, 0.95),
+                "worker_wait_p50_s": pct(self._worker_wait_s, 0.50),
+                "worker_wait_p95_s": pct(self._worker_wait_s, 0.95),
+                "run_time_p50_s": pct(self._run_time_s, 0.50),
+                "run_time_p95_s": pct(self._run_time_s, 0.95),
+            }
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def pool_from_env() -> ImageWorkerPool:
+    """Builds the process-wide pool from MUSE_IMAGE_* environment settings."""
+    max_workers = os.getenv("MUSE_IMAGE_WORKERS")
+    max_pending = os.getenv("MUSE_IMAGE_MAX_PENDING")
+    return ImageWorkerPool(
+        kind=os.getenv("MUSE_IMAGE_POOL", "thread"),
+        max_workers=int(max_workers) if max_workers else None,
+        max_pending=int(max_pending) if max_pending else None,
+        task_timeout_s=float(os.getenv("MUSE_IMAGE_TASK_TIMEOUT_S", "30")),
+        queue_timeout_s=float(os.getenv("MUSE_IMAGE_QUEUE_TIMEOUT_S", "5")),
+    )
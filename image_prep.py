@@ -0,0 +1,107 @@
+# image_prep.py
+
+# Image preparation shared by the Ollama (app.py) and Gemini (app2.py) stylists.
+# Every request decodes the upload, flattens it to RGB and re-encodes it as JPEG before it is sent
+# to the model, so this module is kept free of Streamlit to make it importable from benchmarks.
+
+import base64
+import os
+from io import BytesIO
+from PIL import Image, ImageOps
+
+# Background used when flattening transparent images, since JPEG doesn't support transparency
+BACKGROUND_COLOR = (255, 255, 255)
+# Longest side of the preview rendition shown in the browser. st.image passes JPEG bytes up to
+# 1460 px wide through untouched (WebP would be re-encoded), so previews are progressive JPEGs.
+PREVIEW_MAX_SIDE = int(os.getenv("MUSE_PREVIEW_MAX_PX", "1024"))
+PREVIEW_QUALITY = 80
+
+
+def open_image(data: bytes) -> Image.Image:
+    """Decodes uploaded image bytes into a fully loaded PIL Image."""
+    image = Image.open(BytesIO(data))
+    image.load()
+    return image
+
+
+def flatten_to_rgb(image: Image.Image) -> Image.Image:
+    """
+    Converts any image mode to RGB for JPEG encoding.
+    Images with an alpha channel (RGBA, LA) or palette transparency (P) are composited onto a white background.
+    """
+    image_mode = image.mode
+    if image_mode in ("RGBA", "LA"):
+        # Create a white background and paste the image with alpha channel
+        rgb_image = Image.new("RGB", image.size, BACKGROUND_COLOR)
+        rgb_image.paste(image, mask=image.split()[-1])
+        return rgb_image
+    if image_mode == "P":
+        # Convert palette mode - check if it has transparency
+        if "transparency" in image.info:
+            # Has transparency, convert to RGBA then to RGB with white background
+            rgba_image = image.convert("RGBA")
+            rgb_image = Image.new("RGB", rgba_image.size, BACKGROUND_COLOR)
+            rgb_image.paste(rgba_image, mask=rgba_image.split()[-1])
+            return rgb_image
+        # No transparency, just convert to RGB
+        return image.convert("RGB")
+    if image_mode != "RGB":
+        # Convert any other mode (like L grayscale, CMYK, etc.) to RGB
+        return image.convert("RGB")
+    return image
+
+
+def encode_jpeg(image: Image.Image, quality: int = 75) -> bytes:
+    """Saves an RGB image as JPEG into an in-memory byte buffer."""
+    buffered = BytesIO()
+    image.save(buffered, format="JPEG", quality=quality)
+    return buffered.getvalue()
+
+
+def image_to_jpeg_bytes(image: Image.Image, quality: int = 95) -> bytes:
+    """Converts a PIL Image object of any mode to JPEG bytes for the Gemini API."""
+    return encode_jpeg(flatten_to_rgb(image), quality=quality)
+
+
+def encode_image_to_base64(image: Image.Image, quality: int = 75) -> str:
+    """Converts a PIL Image object to a base64 string for the Ollama API."""
+    return base64.b64encode(encode_jpeg(flatten_to_rgb(image), quality=quality)).decode("utf-8")
+
+
+def make_preview(item, max_side: int = PREVIEW_MAX_SIDE, quality: int = PREVIEW_QUALITY) -> bytes:
+    """
+    Downscaled, progressive JPEG rendition of an upload (bytes or PIL image) for display.
+    JPEG uploads are decoded at reduced scale, which is much cheaper than a full decode.
+    """
+    if isinstance(item, Image.Image):
+        image = item.copy()
+    else:
+        image = Image.open(BytesIO(item))
+        image.draft(None, (max_side, max_side))
+    # Bake in the EXIF orientation, since the re-encoded preview drops the EXIF data
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_side, max_side), Image.LANCZOS, reducing_gap=3.0)
+    buffered = BytesIO()
+    flatten_to_rgb(image).save(buffered, format="JPEG", quality=quality, progressive=True, optimize=True)
+    return buffered.getvalue()
+
+
+# --- Pool tasks (see image_pool.py): accept upload bytes or an already decoded image ---
+def as_image(item) -> Image.Image:
+    """Decodes upload bytes, passing PIL images through unchanged."""
+    return item if isinstance(item, Image.Image) else open_image(item)
+
+
+def prepare_ollama_payload(item) -> str:
+    """Decode + flatten + JPEG + base64 for the Ollama API."""
+    return encode_image_to_base64(as_image(item))
+
+
+def prepare_gemini_payload(item) -> bytes:
+    """Decode + flatten + JPEG (quality 95) for the Gemini API."""
+    return image_to_jpeg_bytes(as_image(item), quality=95)
+
+
+def prepare_preview(item) -> bytes:
+    """Preview rendition for the Wardrobe Preview column."""
+    return make_preview(item)
@@ -0,0 +1,196 @@
+# memory_budget.py
+
+# Process-wide memory accounting for everything the apps keep between reruns.
+# With many concurrent sessions, per-session images, prepared payloads and results would grow
+# RSS without bound, so every cache goes through one MemoryBudget: entries are sized when stored,
+# and once the configured budget is exceeded the entries that are cheapest to recompute per byte
+# and least recently used are evicted first (GreedyDual-Size). Optional tracemalloc breakdowns
+# show where the rest of the process memory goes.
+
+import hashlib
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from PIL import Image
+
+# Categories shown in the diagnostics view; any other name is accepted too
+CATEGORIES = ("image", "payload", "result")
+
+
+def estimate_size(value) -> int:
+    """Approximate bytes held by a cached value, including PIL pixel buffers."""
+    if isinstance(value, Image.Image):
+        return value.width * value.height * len(value.getbands()) + sys.getsizeof(value)
+    if isinstance(value, (bytes, bytearray, str)):
+        return sys.getsizeof(value)
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    return sys.getsizeof(value)
+
+
+def digest(data: bytes) -> str:
+    """Content key for uploads, so identical images share cache entries across sessions."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class MemoryBudget:
+    """
+    Byte-accounted cache shared by all sessions, bounded by `limit_bytes`.
+
+    Each entry has a priority of L + cost / size, where cost is the seconds it took to
+    compute and L is the priority of the last evicted entry. Reading an entry refreshes
+    its priority, so the lowest-priority entry is the least recently used one among those
+    that are cheap to rebuild for the memory they hold.
+    """
+
+    def __init__(self, limit_bytes: int):
+        self.limit_bytes = limit_bytes
+        self._entries = {}
+        self._inflation = 0.0
+        self._clock = 0
+        self._used_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "rejected": 0}
+
+    def _priority(self, cost: float, size: int) -> tuple:
+        # Ties (e.g. before anything was evicted) fall back to least recently used
+        self._clock += 1
+        return (self._inflation + cost / max(1, size), self._clock)
+
+    def get(self, category: str, key: str, default=None, count_stats: bool = True):
+        """
+        Returns the cached value (refreshing its priority) or `default`.
+        Lookups that aren't cache reads, such as re-showing a result, pass count_stats=False
+        so they don't skew the hit and miss counters.
+        """
+        with self._lock:
+            entry = self._entries.get((category, key))
+            if entry is None:
+                if count_stats:
+                    self._stats["misses"] += 1
+                return default
+            if count_stats:
+                self._stats["hits"] += 1
+            entry["priority"] = self._priority(entry["cost"], entry["size"])
+            entry["last_used"] = time.time()
+            return entry["value"]
+
+    def put(self, category: str, key: str, value, cost: float = 1.0, size: int = None) -> bool:
+        """
+        Stores a value, evicting others as needed. Returns False (and stores nothing)
+        when the value alone is larger than the whole budget.
+        """
+        size = estimate_size(value) if size is None else size
+        with self._lock:
+            self._remove((category, key))
+            if size > self.limit_bytes:
+                self._stats["rejected"] += 1
+                return False
+            self._entries[(category, key)] = {
+                "value": value,
+                "size": size,
+                "cost": cost,
+                "priority": self._priority(cost, size),
+                "last_used": time.time(),
+            }
+            self._used_bytes += size
+            while self._used_bytes > self.limit_bytes:
+                victim = min(self._entries, key=lambda k: self._entries[k]["priority"])
+                self._inflation = self._entries[victim]["priority"][0]
+                self._remove(victim)
+                self._stats["evictions"] += 1
+            return True
+
+    def cached(self, category: str, key: str, compute):
+        """Returns the cached value, or computes, stores and returns it (cost = compute time)."""
+        value = self.get(category, key)
+        if value is not None:
+            return value
+        start = time.perf_counter()
+        value = compute()
+        self.put(category, key, value, cost=time.perf_counter() - start)
+        return value
+
+    def discard(self, category: str, key: str):
+        with self._lock:
+            self._remove((category, key))
+
+    def _remove(self, entry_key):
+        entry = self._entries.pop(entry_key, None)
+        if entry is not None:
+            self._used_bytes -= entry["size"]
+
+    @property
+    def used_bytes(self) -> int:
+        return self._used_bytes
+
+    def snapshot(self) -> dict:
+        """Totals and per-category usage for the diagnostics view."""
+        with self._lock:
+            categories = {name: {"entries": 0, "bytes": 0} for name in CATEGORIES}
+            for (category, _), entry in self._entries.items():
+                usage = categories.setdefault(category, {"entries": 0, "bytes": 0})
+                usage["entries"] += 1
+                usage["bytes"] += entry["size"]
+            return {
+                "limit_bytes": self.limit_bytes,
+                "used_bytes": self._used_bytes,
+                "entries": len(self._entries),
+                "categories": categories,
+                **self._stats,
+            }
+
+
+def budget_from_env() -> MemoryBudget:
+    """Builds the process-wide budget from MUSE_MEMORY_BUDGET_MB (default 512 MB)."""
+    return MemoryBudget(int(float(os.getenv("MUSE_MEMORY_BUDGET_MB", "512")) * 1024 * 1024))
+
+
+# --- Diagnostics ---
+def start_tracing_from_env():
+    """Starts tracemalloc when MUSE_TRACEMALLOC is set (value = stack frames to keep)."""
+    frames = os.getenv("MUSE_TRACEMALLOC")
+    if frames and not tracemalloc.is_tracing():
+        tracemalloc.start(int(frames) if frames.isdigit() else 1)
+
+
+def peak_rss_bytes() -> int:
+    """Peak resident set size of this process (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def tracemalloc_breakdown(limit: int = 10, group_by: str = "filename") -> dict:
+    """
+    Top Python allocation sites from tracemalloc, or None if tracing is off.
+    Pillow pixel buffers are allocated outside Python's allocator and don't show up here;
+    they are counted by the MemoryBudget instead.
+    """
+    if not tracemalloc.is_tracing():
+        return None
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    ))
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "traced_bytes": current,
+        "traced_peak_bytes": peak,
+        "top": [
+            {"where": str(stat.traceback), "bytes": stat.size, "blocks": stat.count}
+            for stat in snapshot.statistics(group_by)[:limit]
+        ],
+    }
+
+
+def format_bytes(size: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(size) < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
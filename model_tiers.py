@@ -0,0 +1,221 @@
+# model_tiers.py
+
+# Latency-SLO-driven model tiering shared by the Ollama (app.py) and Gemini (app2.py) stylists.
+# A ladder of models is ordered from the cheapest/fastest tier to the best/slowest one, and a
+# controller picks a tier per request from the latency target, the number of requests currently
+# in flight and the latency it has measured for each tier.
+
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class ModelTier:
+    """A single rung of the model ladder."""
+
+    def __init__(self, name: str, expected_latency_s: float):
+        self.name = name
+        # Prior estimate used until the controller has measured real requests for this tier
+        self.expected_latency_s = expected_latency_s
+
+    def __repr__(self) -> str:
+        return f"ModelTier({self.name!r}, expected_latency_s={self.expected_latency_s})"
+
+
+def parse_tier_ladder(spec: str) -> list:
+    """
+    Parses a ladder spec such as "moondream:1.8b=5,llava:7b=15,llava:13b=40".
+
+    Tiers are comma separated, fastest first. The optional "=<seconds>" suffix is the
+    expected latency of one request on that tier before any measurements exist.
+    """
+    tiers = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, latency = item.rpartition("=")
+        if not sep:
+            name, latency = item, "30"
+        try:
+            expected_latency_s = float(latency)
+        except ValueError:
+            raise ValueError(f"Invalid expected latency {latency!r} for model tier {name!r}")
+        tiers.append(ModelTier(name.strip(), expected_latency_s))
+    if not tiers:
+        raise ValueError("The model tier ladder must contain at least one model.")
+    return tiers
+
+
+def load_tier_ladder(env_var: str, default_spec: str) -> list:
+    """Reads a ladder spec from the environment, falling back to the app's default ladder."""
+    return parse_tier_ladder(os.getenv(env_var) or default_spec)
+
+
+class TierController:
+    """
+    Picks the best model tier whose predicted latency still meets the latency SLO.
+
+    Each tier keeps an exponentially weighted average of its service time: the measured
+    latency divided by the queueing factor it was started under, so load isn't counted
+    twice when the prediction stretches the estimate by the requests already in flight
+    beyond the backend's concurrency. The average decays back towards the tier's expected
+    latency with `half_life_s`, and when nothing is queued the next tier up is probed every
+    `probe_interval_s` if its expected latency fits the SLO, so a single slow request (e.g. a
+    cold model load) can't lock a tier out for good. Timed out requests count as samples of
+    their full wall time, so a tier that keeps timing out stops being chosen. When no tier fits, the fastest tier serves the request: a simpler answer
+    in a few seconds beats a perfect one in a minute.
+    Every decision is kept in a bounded history so the UI can show which tier served a request.
+    """
+
+    def __init__(self, tiers: list, target_latency_s: float, concurrency: int = 1,
+                 smoothing: float = 0.3, half_life_s: float = 300.0, probe_interval_s: float = 60.0,
+                 history_size: int = 200):
+        if not tiers:
+            raise ValueError("TierController needs at least one model tier.")
+        self.tiers = list(tiers)
+        self.target_latency_s = target_latency_s
+        self.concurrency = max(1, concurrency)
+        self.smoothing = smoothing
+        self.half_life_s = half_life_s
+        self.probe_interval_s = probe_interval_s
+        self.history = deque(maxlen=history_size)
+        now = time.monotonic()
+        # Per tier: smoothed service time, when it was last updated, sample count, last time chosen
+        self._service_s = {tier.name: None for tier in self.tiers}
+        self._updated_at = {tier.name: now for tier in self.tiers}
+        self._samples = {tier.name: 0 for tier in self.tiers}
+        self._last_chosen = {tier.name: now for tier in self.tiers}
+        self._unavailable = set()
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def _queue_factor(self, queue_depth: int) -> float:
+        return 1 + queue_depth / self.concurrency
+
+    def estimated_latency(self, tier: ModelTier) -> float:
+        """Service time estimate for a tier, decaying towards its expected latency as it ages."""
+        service_s = self._service_s[tier.name]
+        if service_s is None:
+            return tier.expected_latency_s
+        age_s = time.monotonic() - self._updated_at[tier.name]
+        weight = 0.5 ** (age_s / self.half_life_s) if self.half_life_s > 0 else 1.0
+        return tier.expected_latency_s + (service_s - tier.expected_latency_s) * weight
+
+    def predicted_latency(self, tier: ModelTier, queue_depth: int) -> float:
+        """Latency a new request on this tier would see with `queue_depth` requests ahead of it."""
+        return self.estimated_latency(tier) * self._queue_factor(queue_depth)
+
+    def _choose_locked(self, queue_depth: int) -> tuple:
+        """
+        Returns (tier, is_probe) for the largest available tier predicted to meet the SLO,
+        else the fastest one, and marks the tier as chosen.
+        """
+        available = [tier for tier in self.tiers if tier.name not in self._unavailable]
+        if not available:
+            # Every tier failed as unavailable; retry the whole ladder rather than refusing service
+            self._unavailable.clear()
+            available = self.tiers
+        index = 0
+        for i in range(len(available) - 1, -1, -1):
+            if self.predicted_latency(available[i], queue_depth) <= self.target_latency_s:
+                index = i
+                break
+
+        probe = False
+        now = time.monotonic()
+        if queue_depth == 0 and index + 1 < len(available):
+            # Idle: re-measure the next tier up once in a while so its estimate can recover from
+            # a slow outlier; tiers that can't meet the SLO even when idle are never probed
+            above = available[index + 1]
+            fits_slo = above.expected_latency_s * self._queue_factor(0) <= self.target_latency_s
+            last_seen = max(self._last_chosen[above.name], self._updated_at[above.name])
+            if fits_slo and now - last_seen >= self.probe_interval_s:
+                index, probe = index + 1, True
+        tier = available[index]
+        self._last_chosen[tier.name] = now
+        return tier, probe
+
+    def _record_locked(self, tier: ModelTier, service_s: float):
+        previous = self._service_s[tier.name]
+        if previous is None:
+            self._service_s[tier.name] = service_s
+        else:
+            # Fold the sample into the decayed estimate, so old outliers don't come back
+            decayed = self.estimated_latency(tier)
+            self._service_s[tier.name] = self.smoothing * service_s + (1 - self.smoothing) * decayed
+        self._updated_at[tier.name] = time.monotonic()
+        self._samples[tier.name] += 1
+
+    def mark_unavailable(self, tier: ModelTier) -> bool:
+        """
+        Excludes a tier (e.g. a model that is not pulled) from future decisions.
+        Returns True if another tier is still available to fall back to.
+        """
+        with self._lock:
+            self._unavailable.add(tier.name)
+            return any(t.name not in self._unavailable for t in self.tiers)
+
+    @contextmanager
+    def serve(self):
+        """
+        Chooses a tier and counts the request as in flight for the duration of the block.
+
+        Yields a decision dict; the block may set decision["ok"] = False on failure, and
+        decision["timed_out"] = True when the failure was the backend not answering in time.
+        Successful requests feed the tier's service time estimate with their measured
+        latency divided by the queueing factor they started under; timed out ones with
+        their whole measured latency, since the real service time is at least that long.
+        """
+        with self._lock:
+            queue_depth = self._in_flight
+            tier, probe = self._choose_locked(queue_depth)
+            self._in_flight += 1
+            predicted_latency_s = self.predicted_latency(tier, queue_depth)
+        decision = {
+            "tier": tier,
+            "model": tier.name,
+            "queue_depth": queue_depth,
+            "predicted_latency_s": predicted_latency_s,
+            "probe": probe,
+            "ok": True,
+            "timed_out": False,
+        }
+        start = time.perf_counter()
+        try:
+            yield decision
+        except BaseException as e:
+            decision["ok"] = False
+            if isinstance(e, TimeoutError):
+                decision["timed_out"] = True
+            raise
+        finally:
+            decision["latency_s"] = time.perf_counter() - start
+            decision["finished_at"] = time.time()
+            with self._lock:
+                self._in_flight -= 1
+                if decision["ok"]:
+                    self._record_locked(tier, decision["latency_s"] / self._queue_factor(queue_depth))
+                elif decision["timed_out"]:
+                    self._record_locked(tier, decision["latency_s"])
+                self.history.append({k: v for k, v in decision.items() if k != "tier"})
+
+    def snapshot(self) -> dict:
+        """Current state of the controller for diagnostics."""
+        with self._lock:
+            return {
+                "target_latency_s": self.target_latency_s,
+                "queue_depth": self._in_flight,
+                "tiers": [
+                    {
+                        "model": tier.name,
+                        "estimated_latency_s": round(self.estimated_latency(tier), 3),
+                        "samples": self._samples[tier.name],
+                        "available": tier.name not in self._unavailable,
+                    }
+                    for tier in self.tiers
+                ],
+                "recent": list(self.history)[-10:],
+            }
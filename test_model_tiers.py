@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Tests for the model tier controller (model_tiers.py), driven by a fake clock
+so that latencies, decay and probe intervals don't depend on real time.
+"""
+import pytest
+
+import model_tiers
+from model_tiers import TierController, parse_tier_ladder
+
+OLLAMA_TIERS = "moondream:1.8b=5,llava:7b=15,llava:13b=40"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(model_tiers.time, "monotonic", fake)
+    monkeypatch.setattr(model_tiers.time, "perf_counter", fake)
+    return fake
+
+
+def serve_one(controller, clock, service_s=None, error=None):
+    """Serves one request that takes `service_s` (default: the tier's expected latency)."""
+    try:
+        with controller.serve() as decision:
+            tier = decision["tier"]
+            clock.advance(tier.expected_latency_s if service_s is None else service_s)
+            if error is not None:
+                raise error
+    except type(error) if error is not None else ():
+        pass
+    return decision
+
+
+def test_low_traffic_never_probes_tiers_that_cannot_meet_the_slo(clock):
+    controller = TierController(parse_tier_ladder(OLLAMA_TIERS), target_latency_s=20)
+    models = []
+    for _ in range(20):
+        clock.advance(90)
+        models.append(serve_one(controller, clock)["model"])
+    assert "llava:13b" not in models
+    assert models.count("llava:7b") == 20
+
+
+def test_slow_outlier_recovers_through_idle_probe(clock):
+    controller = TierController(parse_tier_ladder(OLLAMA_TIERS), target_latency_s=20)
+    assert serve_one(controller, clock, service_s=60)["model"] == "llava:7b"
+    # The outlier pushes llava:7b above the SLO, so the next request drops a tier
+    assert serve_one(controller, clock)["model"] == "moondream:1.8b"
+
+    clock.advance(controller.probe_interval_s)
+    decision = serve_one(controller, clock)
+    assert decision["model"] == "llava:7b"
+    assert decision["probe"]
+
+    # A few fast probes bring the estimate back within the SLO well before it decays on its own
+    for _ in range(5):
+        clock.advance(controller.probe_interval_s)
+        serve_one(controller, clock)
+    decision = serve_one(controller, clock)
+    assert decision["model"] == "llava:7b"
+    assert not decision["probe"]
+
+
+def test_timeouts_count_against_the_tier(clock):
+    controller = TierController(parse_tier_ladder(OLLAMA_TIERS), target_latency_s=20)
+    decision = serve_one(controller, clock, service_s=120, error=TimeoutError("no answer"))
+    assert decision["model"] == "llava:7b"
+    assert decision["timed_out"] and not decision["ok"]
+    assert controller.snapshot()["tiers"][1]["samples"] == 1
+    assert serve_one(controller, clock)["model"] == "moondream:1.8b"
+
+
+def test_other_failures_leave_the_estimate_alone(clock):
+    controller = TierController(parse_tier_ladder(OLLAMA_TIERS), target_latency_s=20)
+    serve_one(controller, clock, service_s=120, error=ValueError("bad request"))
+    assert controller.snapshot()["tiers"][1]["samples"] == 0
+    assert serve_one(controller, clock)["model"] == "llava:7b"
+
+
+def test_load_drops_to_a_smaller_tier(clock):
+    controller = TierController(parse_tier_ladder(OLLAMA_TIERS), target_latency_s=20)
+    with controller.serve() as first:
+        with controller.serve() as second:
+            pass
+    assert first["model"] == "llava:7b"
+    assert second["model"] == "moondream:1.8b"